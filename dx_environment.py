@@ -13,7 +13,7 @@ Usage:
   dx_environment.py (--type <name> --env_name <name> --host_user <username> \
 --ip <address> [--toolkit <path_to_the_toolkit>] [--ase --ase_user <name> --ase_pw <name>] \
 |--update_ase_pw <name> --env_name <name> | --update_ase_user <name> --env_name <name> \
-| --delete <env_name> | --refresh <env_name> | --list)
+| --delete <env_name> | --refresh <env_name> | --list [--json])
 [--logdir <directory>][--debug] [--config <filename>] [--connector_name <name>]
 [--pw <password>][--engine <identifier>][--all] [--poll <n>]
   dx_environment.py (--update_host --old_host_address <name> --new_host_address <name>) [--logdir <directory>][--debug] [--config <filename>]
@@ -32,12 +32,15 @@ Examples:
   dx_environment.py --enable --env_name SOURCE
   dx_environment.py --disable --env_name SOURCE
   dx_environment.py --list
+  dx_environment.py --list --json
 
 Options:
   --type <name>             The OS type for the environment
   --env_name <name>         The name of the Delphix environment
   --ip <addr>               The IP address of the Delphix environment
   --list                    List all of the environments for a given engine
+  --json                    Print the environment list as JSON, one array
+                            per engine. Messages are printed to stderr.
   --toolkit <path>          Path of the toolkit. Required for Unix/Linux
   --host_user <username>    The username on the Delphix environment
   --delete <environment>    The name of the Delphix environment to delete
@@ -73,11 +76,14 @@ from __future__ import print_function
 
 VERSION = "v.0.3.612"
 
+import json
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from os.path import basename
+from time import perf_counter
 from time import sleep
-from time import time
 
 from docopt import docopt
 
@@ -98,203 +104,224 @@ from lib.DxLogging import logging_est
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_exception
 from lib.DxLogging import print_info
+from lib.DxLogging import set_console
 from lib.GetReferences import find_all_objects
 from lib.GetReferences import find_obj_by_name
-from lib.GetReferences import find_obj_name
 from lib.GetSession import GetSession
 
+# Environment types that are listed without a host
+CLUSTER_ENV_TYPES = frozenset(["WindowsCluster", "OracleCluster"])
+
+# Values accepted by --type
+ENV_TYPES = ("linux", "windows")
+
+# Action flags, in the order they are checked when --type is not given
+ACTION_FLAGS = (
+    "--delete",
+    "--refresh",
+    "--update_ase_pw",
+    "--update_ase_user",
+    "--list",
+    "--update_host",
+    "--enable",
+    "--disable",
+)
+
 
 def enable_environment(dlpx_obj, env_name):
     """
     Enable the given host
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
-
     env_obj = find_obj_by_name(dlpx_obj.server_session, environment, env_name)
 
-    try:
-        environment.enable(dlpx_obj.server_session, env_obj.reference)
-        print ("Attempting to enable {}".format(env_name))
-    except (DlpxException, RequestError) as e:
-        print_exception(
-            "\nERROR: Enabling the host {} "
-            "encountered an error:\n{}".format(env_name, e)
-        )
-        sys.exit(1)
+    environment.enable(dlpx_obj.server_session, env_obj.reference)
+    print("Attempting to enable {}".format(env_name))
 
 
 def disable_environment(dlpx_obj, env_name):
     """
     Enable the given host
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
     env_obj = find_obj_by_name(dlpx_obj.server_session, environment, env_name)
 
-    try:
-        environment.disable(dlpx_obj.server_session, env_obj.reference)
-        print ("Attempting to disable {}".format(env_name))
-    except (DlpxException, RequestError) as e:
-        print_exception(
-            "\nERROR: Disabling the host {} "
-            "encountered an error:\n{}".format(env_name, e)
-        )
-        sys.exit(1)
+    environment.disable(dlpx_obj.server_session, env_obj.reference)
+    print("Attempting to disable {}".format(env_name))
 
 
 def update_host_address(dlpx_obj, old_host_address, new_host_address):
     """
     Update the given host
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
     old_host_obj = find_obj_by_name(dlpx_obj.server_session, host, old_host_address)
     if old_host_obj.type == "WindowsHost":
         host_obj = WindowsHost()
     else:
         host_obj = UnixHost()
     host_obj.address = new_host_address
-    try:
-        host.update(dlpx_obj.server_session, old_host_obj.reference, host_obj)
-
-        print (
-            "Attempting to update {} to {}".format(old_host_address, new_host_address)
-        )
-
-    except (DlpxException, RequestError) as e:
-        print_exception(
-            "\nERROR: Updating the host {} "
-            "encountered an error:\n{}".format(env_name, e)
-        )
-        sys.exit(1)
+    host.update(dlpx_obj.server_session, old_host_obj.reference, host_obj)
+    print("Attempting to update {} to {}".format(old_host_address, new_host_address))
 
 
-def list_env(dlpx_obj):
+def list_env(dlpx_obj, engine_name, as_json=False):
     """
     List all environments for a given engine
-    """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
 
+    engine_name: Name of the engine, added to each JSON row
+    as_json: Print the list as one JSON array instead of text. Default: False
+    """
     all_envs = environment.get_all(dlpx_obj.server_session)
+    # Fetch the users and hosts once instead of looking them up per environment
+    users = {
+        user_obj.reference: user_obj.name
+        for user_obj in environment.user.get_all(dlpx_obj.server_session)
+    }
+    hosts = {
+        host_obj.reference: host_obj.name
+        for host_obj in host.get_all(dlpx_obj.server_session)
+    }
+    # Collect the output and print it once, rather than once per environment
+    env_rows = []
+    env_lines = []
+    # Bind the lookups used on every row to locals
+    user_name = users.get
+    host_name = hosts.get
+    ase_params_cls = ASEHostEnvironmentParameters
     for env in all_envs:
-        env_user = find_obj_name(
-            dlpx_obj.server_session, environment.user, env.primary_user
-        )
-        try:
-            env_host = find_obj_name(dlpx_obj.server_session, host, env.host)
-        except AttributeError:
-            pass
+        env_user = user_name(env.primary_user)
+        # Cluster environments have no host attribute
+        host_ref = getattr(env, "host", None)
+        env_host = host_name(host_ref, "") if host_ref is not None else ""
+        # Every row has the same keys, whatever the environment type
+        env_row = {
+            "engine": engine_name,
+            "name": env.name,
+            "type": env.type,
+            "user": env_user,
+            "host": env_host,
+            "enabled": env.enabled,
+            "ase_params": None,
+        }
 
         if env.type == "WindowsHostEnvironment":
-            print (
+            env_lines.append(
                 "Environment Name: {}, Username: {}, Host: {},"
                 "Enabled: {}, ".format(env.name, env_user, env_host, env.enabled)
             )
-        elif env.type == "WindowsCluster" or env.type == "OracleCluster":
-            print (
+        elif env.type in CLUSTER_ENV_TYPES:
+            env_lines.append(
                 "Environment Name: {}, Username: {}"
                 "Enabled: {}, ".format(env.name, env_user, env.enabled)
             )
         else:
-            print("Environment Name: {}, Username: {}, Host: {}, Enabled: {}," " ASE Environment Params: {}".format(
-                env.name,
-                env_user,
-                env_host,
-                env.enabled,
+            ase_params = (
                 env.ase_host_environment_parameters
-                if isinstance(
-                    env.ase_host_environment_parameters, ASEHostEnvironmentParameters
+                if isinstance(env.ase_host_environment_parameters, ase_params_cls)
+                else None
+            )
+            if ase_params is not None:
+                env_row["ase_params"] = ase_params.to_dict()
+            env_lines.append(
+                "Environment Name: {}, Username: {}, Host: {}, Enabled: {},"
+                " ASE Environment Params: {}".format(
+                    env.name,
+                    env_user,
+                    env_host,
+                    env.enabled,
+                    ase_params if ase_params is not None else "Undefined",
                 )
-                else "Undefined",
-            ))
+            )
+        env_rows.append(env_row)
 
+    if as_json:
+        # A single write keeps each engine's array on its own line when
+        # several engines are listed at once
+        sys.stdout.write(json.dumps(env_rows) + "\n")
+    elif env_lines:
+        print("\n".join(env_lines))
 
-def delete_env(dlpx_obj, env_name):
+
+def delete_env(dlpx_obj, engine_name, env_name):
     """
     Deletes an environment
 
-    engine: Dictionary of engines
+    engine_name: Name of the engine the job is tracked under
     env_name: Name of the environment to delete
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
-
+    # find_obj_by_name raises DlpxException if the environment is not found
     env_obj = find_obj_by_name(dlpx_obj.server_session, environment, env_name)
+    environment.delete(dlpx_obj.server_session, env_obj.reference)
+    dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
 
-    if env_obj:
-        environment.delete(dlpx_obj.server_session, env_obj.reference)
-        dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
-
-    elif env_obj is None:
-        print ("Environment was not found in the Engine: {}".format(env_name))
-        sys.exit(1)
 
-
-def refresh_env(dlpx_obj, env_name):
+def refresh_env(dlpx_obj, engine_name, env_name):
     """
     Refresh the environment
 
-    engine: Dictionary of engines
+    engine_name: Name of the engine the job is tracked under
     env_name: Name of the environment to refresh
+    :return: Names of the environments whose refresh could not be submitted
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
-
     if env_name == "all":
-        env_list = find_all_objects(dlpx_obj.server_session, environment)
+        # Clustered environments can appear more than once, so refresh each
+        # reference only once.
+        env_list = []
+        seen_refs = set()
+        for env_obj in find_all_objects(dlpx_obj.server_session, environment):
+            if env_obj.reference not in seen_refs:
+                seen_refs.add(env_obj.reference)
+                env_list.append(env_obj)
+        if not env_list:
+            print_info("No environments found to refresh")
+            return
+
+        failed_envs = []
+        # Submit every refresh before polling. The jobs run on the engine
+        # concurrently and each one is tracked under its environment.
         for env_obj in env_list:
             try:
                 environment.refresh(dlpx_obj.server_session, env_obj.reference)
-                dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
+                dlpx_obj.jobs[
+                    "{}:{}".format(engine_name, env_obj.reference)
+                ] = dlpx_obj.server_session.last_job
 
             except (DlpxException, RequestError) as e:
                 print_exception(
                     "\nERROR: Refreshing the environment {} "
-                    "encountered an error:\n{}".format(env_name, e)
+                    "encountered an error:\n{}".format(env_obj.name, e)
                 )
-                sys.exit(1)
-    else:
-
-        try:
-            env_obj = find_obj_by_name(dlpx_obj.server_session, environment, env_name)
-
-            environment.refresh(dlpx_obj.server_session, env_obj.reference)
-            dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
-
-        except (DlpxException, RequestError) as e:
-            print_exception(
-                "\nERROR: Refreshing the environment {} "
-                "encountered an error:\n{}".format(env_name, e)
-            )
+                failed_envs.append(env_obj.name)
+        # Only give up now if none of the refreshes could be submitted.
+        # Otherwise main_workflow reports the failures once the jobs finish.
+        if len(failed_envs) == len(env_list):
             sys.exit(1)
+        return failed_envs
+    else:
+        env_obj = find_obj_by_name(dlpx_obj.server_session, environment, env_name)
+        environment.refresh(dlpx_obj.server_session, env_obj.reference)
+        dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
 
 
 def update_ase_username(dlpx_obj):
     """
     Update the ASE database user password
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
-
     env_obj = UnixHostEnvironment()
     env_obj.ase_host_environment_parameters = ASEHostEnvironmentParameters()
     env_obj.ase_host_environment_parameters.db_user = arguments["--update_ase_user"]
 
-    try:
-        environment.update(
-            dlpx_obj.server_session,
-            find_obj_by_name(
-                dlpx_obj.server_session, environment, arguments["--env_name"], env_obj
-            ).reference,
-            env_obj,
-        )
-
-    except (HttpError, RequestError) as e:
-        print_exception(
-            "\nERROR: Updating the ASE DB password " "failed:\n{}\n".format(e)
-        )
+    environment.update(
+        dlpx_obj.server_session,
+        find_obj_by_name(
+            dlpx_obj.server_session, environment, arguments["--env_name"]
+        ).reference,
+        env_obj,
+    )
 
 
 def update_ase_pw(dlpx_obj):
     """
     Update the ASE database user password
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
     env_obj = UnixHostEnvironment()
     env_obj.ase_host_environment_parameters = ASEHostEnvironmentParameters()
     env_obj.ase_host_environment_parameters.credentials = {
@@ -302,26 +329,40 @@ def update_ase_pw(dlpx_obj):
         "password": arguments["--update_ase_pw"],
     }
 
-    try:
-        environment.update(
-            dlpx_obj.server_session,
-            find_obj_by_name(
-                dlpx_obj.server_session, environment, arguments["--env_name"], env_obj
-            ).reference,
-            env_obj,
-        )
+    environment.update(
+        dlpx_obj.server_session,
+        find_obj_by_name(
+            dlpx_obj.server_session, environment, arguments["--env_name"]
+        ).reference,
+        env_obj,
+    )
 
-    except (HttpError, RequestError) as e:
-        print_exception(
-            "\nERROR: Updating the ASE DB password " "failed:\n{}\n".format(e)
-        )
+
+def build_primary_user(host_user, pw=None):
+    """
+    Return the primary user parameters for a new environment.
+
+    host_user: The server account used to authenticate
+    pw: Password of the user. Default: None (use SSH keys instead)
+    """
+    if pw is None:
+        print_debug("Creating the environment with SSH Keys")
+        credential = {"type": "SystemKeyCredential"}
+    else:
+        print_debug("Creating the environment with a password")
+        credential = {"type": "PasswordCredential", "password": pw}
+
+    return {"type": "EnvironmentUser", "name": host_user, "credential": credential}
 
 
-def create_linux_env(dlpx_obj, env_name, host_user, ip_addr, toolkit_path, pw=None):
+def create_linux_env(
+    dlpx_obj, engine_name, env_name, host_user, ip_addr, toolkit_path, pw=None
+):
 
     """
     Create a Linux environment.
 
+    engine_name: Name of the engine the job is tracked under
     env_name: The name of the environment
     host_user: The server account used to authenticate
     ip_addr: DNS name or IP address of the environment
@@ -329,24 +370,9 @@ def create_linux_env(dlpx_obj, env_name, host_user, ip_addr, toolkit_path, pw=No
                   writable by the host_user
     pw: Password of the user. Default: None (use SSH keys instead)
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
     env_params_obj = HostEnvironmentCreateParameters()
 
-    if pw is None:
-        print_debug("Creating the environment with SSH Keys")
-        env_params_obj.primary_user = {
-            "type": "EnvironmentUser",
-            "name": host_user,
-            "credential": {"type": "SystemKeyCredential"},
-        }
-
-    else:
-        print_debug("Creating the environment with a password")
-        env_params_obj.primary_user = {
-            "type": "EnvironmentUser",
-            "name": host_user,
-            "credential": {"type": "PasswordCredential", "password": pw},
-        }
+    env_params_obj.primary_user = build_primary_user(host_user, pw)
 
     env_params_obj.host_parameters = {
         "type": "UnixHostCreateParameters",
@@ -358,68 +384,51 @@ def create_linux_env(dlpx_obj, env_name, host_user, ip_addr, toolkit_path, pw=No
         },
     }
 
-    env_params_obj.host_environment = UnixHostEnvironment()
-    env_params_obj.host_environment.name = env_name
+    # Build the host environment, including any ASE parameters, before
+    # attaching it to the create parameters.
+    host_env_obj = UnixHostEnvironment()
+    host_env_obj.name = env_name
 
     if arguments["--ase"]:
-        env_params_obj.host_environment.ase_host_environment_parameters = (
-            ASEHostEnvironmentParameters()
-        )
-
-        try:
-            env_params_obj.host_environment.ase_host_environment_parameters.db_user = (
-                arguments["--ase_user"]
-            )
-            env_params_obj.host_environment.ase_host_environment_parameters.credentials = {
-                "type": "PasswordCredential",
-                "password": arguments["--ase_pw"],
-            }
-        except KeyError:
-            print_exception(
-                "The --ase_user and --ase_pw arguments are"
-                " required with the --ase flag.\n"
-            )
+        ase_params_obj = ASEHostEnvironmentParameters()
+        ase_params_obj.db_user = arguments["--ase_user"]
+        ase_params_obj.credentials = {
+            "type": "PasswordCredential",
+            "password": arguments["--ase_pw"],
+        }
+        host_env_obj.ase_host_environment_parameters = ase_params_obj
 
-    try:
-        environment.create(dlpx_obj.server_session, env_params_obj)
-        dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
+    env_params_obj.host_environment = host_env_obj
 
-    except (DlpxException, RequestError, HttpError) as e:
-        print (
-            "\nERROR: Encountered an exception while creating the "
-            "environment:\n{}".format(e)
-        )
-    except JobError as e:
-        print_exception(
-            "JobError while creating environment {}:\n{}".format(e, e.message)
-        )
+    environment.create(dlpx_obj.server_session, env_params_obj)
+    dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
 
 
 def create_windows_env(
-    dlpx_obj, env_name, host_user, ip_addr, pw=None, connector_name=None
+    dlpx_obj, engine_name, env_name, host_user, ip_addr, pw=None, connector_name=None
 ):
 
     """
     Create a Windows environment.
 
+    engine_name: Name of the engine the job is tracked under
     env_name: The name of the environment
     host_user: The server account used to authenticate
     ip_addr: DNS name or IP address of the environment
     toolkit_path: Path to the toolkit. Note: This directory must be
                   writable by the host_user
-    pw: Password of the user. Default: None (use SSH keys instead)
+    pw: Password of the user. Required, Windows environments cannot use
+        SSH keys
     """
-    engine_name = dlpx_obj.dlpx_engines.keys()[0]
+    if pw is None:
+        raise DlpxException(
+            "The --pw argument is required to create the Windows "
+            "environment {}".format(env_name)
+        )
 
     env_params_obj = HostEnvironmentCreateParameters()
 
-    print_debug("Creating the environment with a password")
-
-    env_params_obj.primary_user = {
-        "type": "EnvironmentUser",
-        "name": host_user,
-        "credential": {"type": "PasswordCredential", "password": pw},
-    }
+    env_params_obj.primary_user = build_primary_user(host_user, pw)
 
     env_params_obj.host_parameters = {
         "type": "WindowsHostCreateParameters",
@@ -435,71 +444,45 @@ def create_windows_env(
     env_params_obj.host_environment.name = env_name
 
     if connector_name:
+        # find_obj_by_name raises DlpxException if the connector is not found
         env_obj = find_obj_by_name(dlpx_obj.server_session, environment, connector_name)
+        env_params_obj.host_environment.proxy = env_obj.host
 
-        if env_obj:
-            env_params_obj.host_environment.proxy = env_obj.host
-        elif env_obj is None:
-            print (
-                "Host was not found in the Engine: {}".format(
-                    arguments[--connector_name]
-                )
-            )
-            sys.exit(1)
-
-    try:
-        environment.create(dlpx_obj.server_session, env_params_obj)
-        dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
-
-    except (DlpxException, RequestError, HttpError) as e:
-        print (
-            "\nERROR: Encountered an exception while creating the "
-            "environment:\n{}".format(e)
-        )
+    environment.create(dlpx_obj.server_session, env_params_obj)
+    dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
 
 
-def run_async(func):
+def get_action():
     """
-    http://code.activestate.com/recipes/576684-simple-threading-decorator/
-    run_async(func)
-        function decorator, intended to make "func" run in a separate
-        thread (asynchronously).
-        Returns the created Thread object
-
-        E.g.:
-        @run_async
-        def task1():
-            do_something
-
-        @run_async
-        def task2():
-            do_something_too
-
-        t1 = task1()
-        t2 = task2()
-        ...
-        t1.join()
-        t2.join()
+    Return the action requested on the command line: the --type value, or
+    the first action flag given. Exits with a usage error if there is none,
+    so that it is reported once rather than once per engine.
     """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target=func, args=args, kwargs=kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
+    op_type = arguments["--type"]
+    if op_type:
+        if op_type not in ENV_TYPES:
+            print_exception(
+                "ERROR: Unsupported environment type {}. Please specify one "
+                "of {}".format(op_type, ", ".join(ENV_TYPES))
+            )
+            sys.exit(1)
+        return op_type
+    action = next((flag for flag in ACTION_FLAGS if arguments[flag]), None)
+    if action is None:
+        print_exception(
+            "ERROR: No action given. Please specify one of --type, {}".format(
+                ", ".join(ACTION_FLAGS)
+            )
+        )
+        sys.exit(1)
+    return action
 
 
-@run_async
 def main_workflow(engine, dlpx_obj):
     """
     This function is where we create our main workflow.
-    Use the @run_async decorator to run this function asynchronously.
-    The @run_async decorator allows us to run against multiple Delphix Engine
-    simultaneously
+    run_job() calls it in a worker thread per engine, which allows us to run
+    against multiple Delphix Engines simultaneously
 
     :param engine: Dictionary of engines
     :type engine: dictionary
@@ -515,68 +498,58 @@ def main_workflow(engine, dlpx_obj):
 
     except DlpxException as e:
         print_exception(
-            "ERROR: Engine {} encountered an error while"
-            "{}:\n{}\n".format(engine["hostname"], arguments["--target"], e)
+            "ERROR: Engine {} encountered an error while "
+            "connecting:\n{}\n".format(engine["hostname"], e)
         )
         sys.exit(1)
 
-    thingstodo = ["thingtodo"]
+    engine_name = engine["hostname"]
+    # Read the arguments once, rather than on every pass of the job loop
+    env_name = arguments["--env_name"]
+    host_user = arguments["--host_user"]
+    pw = arguments["--pw"]
+    ip_addr = arguments["--ip"]
+    toolkit_path = arguments["--toolkit"]
+    connector_name = arguments["--connector_name"]
+    poll = float(arguments["--poll"])
+    as_json = arguments["--json"]
+    # Map the actions to their handlers. main() has already checked the
+    # action. --refresh is called on its own below, as it returns the
+    # environments it could not refresh.
+    handlers = {
+        "linux": lambda: create_linux_env(
+            dlpx_obj, engine_name, env_name, host_user, ip_addr, toolkit_path, pw
+        ),
+        "windows": lambda: create_windows_env(
+            dlpx_obj, engine_name, env_name, host_user, ip_addr, pw, connector_name
+        ),
+        "--delete": lambda: delete_env(dlpx_obj, engine_name, arguments["--delete"]),
+        "--update_ase_pw": lambda: update_ase_pw(dlpx_obj),
+        "--update_ase_user": lambda: update_ase_username(dlpx_obj),
+        "--list": lambda: list_env(dlpx_obj, engine_name, as_json),
+        "--update_host": lambda: update_host_address(
+            dlpx_obj, arguments["--old_host_address"], arguments["--new_host_address"]
+        ),
+        "--enable": lambda: enable_environment(dlpx_obj, env_name),
+        "--disable": lambda: disable_environment(dlpx_obj, env_name),
+    }
+
+    have_work = True
+    failed_refreshes = None
     try:
         with dlpx_obj.job_mode(single_thread):
-            while len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0:
-                if len(thingstodo) > 0:
-                    if (
-                        arguments["--type"] == "linux"
-                        or arguments["--type"] == "windows"
-                    ):
-                        env_name = arguments["--env_name"]
-                        host_user = arguments["--host_user"]
-                        pw = arguments["--pw"]
-                        ip_addr = arguments["--ip"]
-                        host_name = arguments["--connector_name"]
-                        if arguments["--type"] == "linux":
-                            toolkit_path = arguments["--toolkit"]
-                            create_linux_env(
-                                dlpx_obj, env_name, host_user, ip_addr, toolkit_path, pw
-                            )
-                        else:
-                            create_windows_env(
-                                dlpx_obj,
-                                env_name,
-                                host_user,
-                                ip_addr,
-                                pw,
-                                host_name,
-                            )
-
-                    elif arguments["--delete"]:
-                        delete_env(dlpx_obj, arguments["--delete"])
-
-                    elif arguments["--refresh"]:
-                        refresh_env(dlpx_obj, arguments["--refresh"])
-
-                    elif arguments["--update_ase_pw"]:
-                        update_ase_pw(dlpx_obj)
-
-                    elif arguments["--update_ase_user"]:
-                        update_ase_username(dlpx_obj)
-                    elif arguments["--list"]:
-                        list_env(dlpx_obj)
-                    elif arguments["--update_host"]:
-                        update_host_address(
-                            dlpx_obj,
-                            arguments["--old_host_address"],
-                            arguments["--new_host_address"],
+            while dlpx_obj.jobs or have_work:
+                if have_work:
+                    if action == "--refresh":
+                        failed_refreshes = refresh_env(
+                            dlpx_obj, engine_name, arguments["--refresh"]
                         )
-                    elif arguments["--enable"]:
-                        enable_environment(dlpx_obj, arguments["--env_name"])
-                    elif arguments["--disable"]:
-                        disable_environment(dlpx_obj, arguments["--env_name"])
-
-                    thingstodo.pop()
+                    else:
+                        handlers[action]()
+                    have_work = False
                 # get all the jobs, then inspect them
                 i = 0
-                for j in dlpx_obj.jobs.keys():
+                for j in list(dlpx_obj.jobs):
                     job_obj = job.get(dlpx_obj.server_session, dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info(
@@ -588,23 +561,46 @@ def main_workflow(engine, dlpx_obj):
                         # If the job is in a non-running state, remove it
                         # from the running jobs list.
                         del dlpx_obj.jobs[j]
-                    elif job_obj.job_state in "RUNNING":
+                    elif job_obj.job_state == "RUNNING":
                         # If the job is in a running state, increment the
                         # running job count.
                         i += 1
-                    print_info("{}: {:d} jobs running.".format(engine["hostname"], i))
-                    # If we have running jobs, pause before repeating the
-                    # checks.
-                    if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments["--poll"]))
+                print_info("{}: {:d} jobs running.".format(engine["hostname"], i))
+                # If we have running jobs, pause once before checking all of
+                # them again.
+                if dlpx_obj.jobs:
+                    sleep(poll)
     except (DlpxException, RequestError, JobError, HttpError) as e:
+        # Errors from every action are reported here, once per engine
         print_exception(
-            "Error while creating the environment {}\n{}".format(
-                arguments["--env_name"], e
+            "\nERROR: {} encountered an error while running {}:\n{}".format(
+                engine_name, action, e
             )
         )
         sys.exit(1)
 
+    if failed_refreshes:
+        print_exception(
+            "\nERROR: {} could not refresh: {}".format(
+                engine_name, ", ".join(failed_refreshes)
+            )
+        )
+        sys.exit(1)
+
+
+def engine_session(dlpx_obj):
+    """
+    Return a new session object for a single engine. Each main_workflow
+    thread gets its own object so that concurrent engines do not overwrite
+    each other's server_session and jobs.
+
+    dlpx_obj: Virtualization Engine session object with the parsed
+    dxtools.conf
+    """
+    engine_obj = GetSession()
+    engine_obj.dlpx_engines = dlpx_obj.dlpx_engines
+    return engine_obj
+
 
 def run_job(dlpx_obj, config_file_path):
     """
@@ -616,24 +612,17 @@ def run_job(dlpx_obj, config_file_path):
     engines
     """
 
-    # Create an empty list to store threads we create.
-    threads = []
+    # Create an empty list to store the engines we run against.
+    engines = []
     engine = None
 
     # If the --all argument was given, run against every engine in dxtools.conf
     if arguments["--all"]:
         print_info("Executing against all Delphix Engines in the dxtools.conf")
 
-        try:
-            # For each server in the dxtools.conf...
-            for delphix_engine in dlpx_obj.dlpx_engines:
-                engine = dlpx_obj.dlpx_engines[delphix_engine]
-                # Create a new thread and add it to the list.
-                threads.append(main_workflow(engine, dlpx_obj))
-
-        except DlpxException as e:
-            print("Error encountered in run_job():\n{}".format(e))
-            sys.exit(1)
+        # For each server in the dxtools.conf...
+        for delphix_engine in dlpx_obj.dlpx_engines:
+            engines.append(dlpx_obj.dlpx_engines[delphix_engine])
 
     elif arguments["--all"] is False:
         # Else if the --engine argument was given, test to see if the engine
@@ -654,6 +643,7 @@ def run_job(dlpx_obj, config_file_path):
                         arguments["--engine"], config_file_path
                     )
                 )
+                sys.exit(1)
         else:
             # Else search for a default engine in the dxtools.conf
             for delphix_engine in dlpx_obj.dlpx_engines:
@@ -670,12 +660,40 @@ def run_job(dlpx_obj, config_file_path):
                 raise DlpxException("\nERROR: No default engine found. Exiting")
 
         # run the job against the engine
-        threads.append(main_workflow(engine, dlpx_obj))
-    # For each thread in the list...
-    for each in threads:
-        # join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+        engines.append(engine)
+
+    if not engines:
+        print_info("No Delphix Engines found in {}".format(config_file_path))
+        return
+
+    # Run main_workflow against each engine in its own worker thread and
+    # report every engine as soon as it finishes, rather than in join order.
+    failed_engines = []
+    with ThreadPoolExecutor(max_workers=len(engines)) as executor:
+        workflows = {
+            executor.submit(main_workflow, engine, engine_session(dlpx_obj)): engine
+            for engine in engines
+        }
+        for workflow in as_completed(workflows):
+            hostname = workflows[workflow]["hostname"]
+            try:
+                workflow.result()
+            except SystemExit:
+                # main_workflow has already printed the error
+                failed_engines.append(hostname)
+                print_exception(
+                    "ERROR: {} did not complete successfully".format(hostname)
+                )
+            except Exception:
+                # Keep collecting the other engines' results
+                failed_engines.append(hostname)
+                print_exception(
+                    "ERROR: {} did not complete successfully:\n{}".format(
+                        hostname, traceback.format_exc()
+                    )
+                )
+    if failed_engines:
+        sys.exit(1)
 
 
 def time_elapsed(time_start):
@@ -683,24 +701,30 @@ def time_elapsed(time_start):
     This function calculates the time elapsed since the beginning of the script.
     Call this anywhere you want to note the progress in terms of time
 
-    :param time_start:  start time of the script.
+    :param time_start:  start time of the script, from perf_counter().
     :type time_start: float
     """
-    return round((time() - time_start) / 60, +1)
+    return round((perf_counter() - time_start) / 60, +1)
 
 
 def main():
     # We want to be able to call on these variables anywhere in the script.
     global single_thread
     global debug
+    global action
 
-    time_start = time()
+    time_start = perf_counter()
     single_thread = False
 
     try:
         dx_session_obj = GetSession()
         logging_est(arguments["--logdir"])
+        if arguments["--json"]:
+            # Keep stdout for the JSON output
+            set_console(sys.stderr)
         print_debug(arguments)
+        # Check the requested action before connecting to any engine
+        action = get_action()
         config_file_path = arguments["--config"]
         # Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
@@ -709,11 +733,6 @@ def main():
         # all the servers.
         run_job(dx_session_obj, config_file_path)
 
-        elapsed_minutes = time_elapsed(time_start)
-        print_info(
-            "script took {:.2f} minutes to get this far.".format(elapsed_minutes)
-        )
-
     # Here we handle what we do when the unexpected happens
     except SystemExit as e:
         # This is what we use to handle our sys.exit(#)
@@ -721,16 +740,14 @@ def main():
 
     except DlpxException as e:
         # We use this exception handler when an error occurs in a function call.
-        print_exception(
-            "ERROR: Please check the ERROR message below:\n" "{}".format(e.message)
-        )
+        print_exception("ERROR: Please check the ERROR message below:\n{}".format(e))
         sys.exit(2)
 
     except HttpError as e:
         # We use this exception handler when our connection to Delphix fails
         print_exception(
-            "ERROR: Connection failed to the Delphix Engine. Please"
-            "check the ERROR message below:\n{}".format(e.message)
+            "ERROR: Connection failed to the Delphix Engine. Please "
+            "check the ERROR message below:\n{}".format(e)
         )
         sys.exit(2)
 
@@ -738,33 +755,23 @@ def main():
         # We use this exception handler when a job fails in Delphix so that we
         # have actionable data
         print_exception("A job failed in the Delphix Engine:\n{}".format(e.job))
-        elapsed_minutes = time_elapsed(time_start)
-        print_exception(
-            "{} took {:.2f} minutes to get this far".format(
-                basename(__file__), elapsed_minutes
-            )
-        )
         sys.exit(3)
 
     except KeyboardInterrupt:
         # We use this exception handler to gracefully handle ctrl+c exits
         print_debug("You sent a CTRL+C to interrupt the process")
-        elapsed_minutes = time_elapsed(time_start)
-        print_info(
-            "{} took {:.2f} minutes to get this far".format(
-                basename(__file__), elapsed_minutes
-            )
-        )
     except:
         # Everything else gets caught here
         print_exception("{}\n{}".format(sys.exc_info()[0], traceback.format_exc()))
-        elapsed_minutes = time_elapsed(time_start)
+        sys.exit(1)
+
+    finally:
+        # Report the elapsed time once, however the script ended
         print_info(
             "{} took {:.2f} minutes to get this far".format(
-                basename(__file__), elapsed_minutes
+                basename(__file__), time_elapsed(time_start)
             )
         )
-        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -7,6 +7,20 @@ import logging
 
 VERSION = "v.0.1.005"
 
+# Stream the print_* functions echo to. None means sys.stdout.
+console = None
+
+
+def set_console(stream):
+    """
+    Echo messages to stream instead of stdout, e.g. sys.stderr when stdout
+    is reserved for machine readable output.
+
+    stream: File object to print messages to. None restores sys.stdout.
+    """
+    global console
+    console = stream
+
 
 def logging_est(logfile_path, debug=False):
     """
@@ -40,7 +54,7 @@ def print_debug(print_obj, debug=False):
     """
     try:
         if debug is True:
-            print("DEBUG: {}".format(str(print_obj)))
+            print("DEBUG: {}".format(str(print_obj)), file=console)
             logging.debug(str(print_obj))
     except:
         pass
@@ -50,7 +64,7 @@ def print_info(print_obj):
     """
     Call this function with a log message to prefix the message with INFO
     """
-    print("INFO: {}".format(str(print_obj)))
+    print("INFO: {}".format(str(print_obj)), file=console)
     logging.info(str(print_obj))
 
 
@@ -58,7 +72,7 @@ def print_warning(print_obj):
     """
     Call this function with a log message to prefix the message with INFO
     """
-    print("WARN: %s" % (str(print_obj)))
+    print("WARN: %s" % (str(print_obj)), file=console)
     logging.warn(str(print_obj))
 
 
@@ -66,5 +80,5 @@ def print_exception(print_obj):
     """
     Call this function with a log message to prefix the message with EXCEPTION
     """
-    print(str(print_obj))
+    print(str(print_obj), file=console)
     logging.exception("EXCEPTION: {}".format(str(print_obj)))